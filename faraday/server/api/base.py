@@ -9,6 +9,7 @@ import logging
 import datetime
 import json
 import re
+from functools import lru_cache
 from json import JSONDecodeError
 from typing import Tuple
 from collections import defaultdict
@@ -16,9 +17,11 @@ from collections import defaultdict
 # Related third party imports
 import flask
 import flask_login
+import orjson
 import sqlalchemy
-from sqlalchemy import func, desc, asc
-from sqlalchemy.orm import joinedload, undefer, with_expression
+from sqlalchemy import func, desc, asc, bindparam
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import joinedload, selectinload, undefer, with_expression
 from sqlalchemy.orm.exc import NoResultFound, ObjectDeletedError
 from sqlalchemy.inspection import inspect
 from sqlalchemy.sql.elements import BooleanClauseList
@@ -27,7 +30,7 @@ from marshmallow import Schema, EXCLUDE, fields
 from marshmallow.validate import Length
 from marshmallow_sqlalchemy import ModelConverter
 from marshmallow_sqlalchemy.schema import SQLAlchemyAutoSchemaOpts, SQLAlchemyAutoSchemaMeta
-from webargs.flaskparser import FlaskParser
+from webargs.flaskparser import FlaskParser, abort as parser_abort
 from webargs.core import ValidationError
 
 # Local application imports
@@ -52,10 +55,13 @@ from faraday.server.models import CVE
 
 logger = logging.getLogger(__name__)
 
+# Compiled SQL of baked queries is cached and reused between requests
+bakery = baked.bakery()
+
 
 def output_json(data, code, headers=None):
     content_type = 'application/json'
-    dumped = json.dumps(data)
+    dumped = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
     if headers:
         headers.update({'Content-Type': content_type})
     else:
@@ -74,6 +80,27 @@ def get_filtered_data(filters, filter_query):
     return data, len(rows)
 
 
+@lru_cache(maxsize=None)
+def get_model_attr_names(model_class):
+    """Return the names of the mapped attributes of ``model_class``.
+
+    Mappers don't change once configured, so the result is computed once
+    per class instead of inspecting the model on every request.
+    """
+    return frozenset(inspect(model_class).attrs.keys())
+
+
+@lru_cache(maxsize=128)
+def _get_context_free_schema(schema_class, schema_kwargs):
+    """Return a shared instance of ``schema_class`` built with
+    ``schema_kwargs``.
+
+    Only schemas with an empty context are cached: they don't hold any
+    request state, so the same instance can be reused between requests.
+    """
+    return schema_class(context={}, **dict(schema_kwargs))
+
+
 def get_group_by_and_sort_dir(model_class):
     group_by = flask.request.args.get('group_by', None)
     sort_dir = flask.request.args.get('order', "asc").lower()
@@ -83,7 +110,7 @@ def get_group_by_and_sort_dir(model_class):
     # Example: /users/count/?group_by=password
     # Also we should check that the field exists in the db and isn't, for
     # example, a relationship
-    if not group_by or group_by not in inspect(model_class).attrs:
+    if not group_by or group_by not in get_model_attr_names(model_class):
         flask.abort(400, {"message": "group_by is a required parameter"})
 
     if sort_dir and sort_dir not in ('asc', 'desc'):
@@ -204,6 +231,15 @@ class GenericView(FlaskView):
     #: to have all hostnames of each host in the hosts endpoint.
     get_joinedloads = []  # List of relationships to eagerload
 
+    #: List of collection relationships to eagerload with a separate
+    #: ``SELECT ... WHERE id IN (...)`` query in list and retrieve views.
+    #:
+    #: Prefer this over get_joinedloads for one-to-many relationships.
+    #: Joining several collections in the same query multiplies the number
+    #: of returned rows, while selectin loading keeps one extra query per
+    #: relationship no matter how many objects are listed.
+    get_selectinloads = []  # List of relationships to selectin load
+
     #: List of columns that will be loaded directly when performing an
     #: eagerloaded query.
     #:
@@ -228,6 +264,10 @@ class GenericView(FlaskView):
 
         It also uses _set_schema_context to set the context of the
         schema.
+
+        Building a schema is expensive, so schemas that end up with an
+        empty context are cached and reused for the same schema class and
+        arguments.
         """
         kwargs['context'] = self._set_schema_context(
             kwargs.get('context', {}), **route_kwargs)
@@ -236,7 +276,17 @@ class GenericView(FlaskView):
         # This is the default in marshmallow 2, but not in marshmallow 3
         kwargs['unknown'] = EXCLUDE
 
-        return self._get_schema_class()(**kwargs)
+        schema_class = self._get_schema_class()
+        if kwargs['context']:
+            return schema_class(**kwargs)
+        schema_kwargs = frozenset((name, value) for name, value in kwargs.items()
+                                  if name != 'context')
+        try:
+            hash(schema_kwargs)
+        except TypeError:
+            # Unhashable arguments (like a list in only), don't cache
+            return schema_class(**kwargs)
+        return _get_context_free_schema(schema_class, schema_kwargs)
 
     def _set_schema_context(self, context, **kwargs):
         """This function can be overridden to update the context passed
@@ -284,8 +334,8 @@ class GenericView(FlaskView):
         slow.
 
         You typically won't need to overwrite this method, but to set
-        get_joinedloads and get_undefer attributes that are used by
-        this method.
+        get_joinedloads, get_selectinloads and get_undefer attributes that
+        are used by this method.
 
         In really complex cases where good performance is required,
         like in the vulns API endpoint, you will have to overwrite this.
@@ -304,6 +354,8 @@ class GenericView(FlaskView):
         query = self._get_base_query(*args, **kwargs)
         options += [joinedload(relationship)
                     for relationship in self.get_joinedloads]
+        options += [selectinload(relationship)
+                    for relationship in self.get_selectinloads]
         options += [undefer(column) for column in self.get_undefer]
         return query.options(*options)
 
@@ -378,8 +430,19 @@ class GenericView(FlaskView):
         data. It a ``Marshmallow.Schema`` instance to perform the
         deserialization
         """
-        return FlaskParser(unknown=EXCLUDE).parse(schema, request, location="json",
-                                                  *args, **kwargs)
+        # Load the body straight with the schema instead of going through a
+        # webargs parser, keeping the error format webargs used
+        body = request.get_json(silent=True, cache=True)
+        if body is None:
+            if request.is_json and request.get_data(cache=True):
+                parser_abort(400, messages={'json': ['Invalid JSON body.']})
+            body = {}
+        kwargs.setdefault('unknown', EXCLUDE)
+        try:
+            return schema.load(body, *args, **kwargs)
+        except ValidationError as error:
+            error = ValidationError({'json': error.messages})
+            parser_abort(422, exc=error, messages=error.messages, schema=schema)
 
     @classmethod
     def register(cls, app, *args, **kwargs):
@@ -387,6 +450,12 @@ class GenericView(FlaskView):
         400 instead of 409"""
         super().register(app, *args, **kwargs)
 
+        # Several views can be registered in the same blueprint, the
+        # handlers only have to be installed once
+        if getattr(app, '_generic_handlers_installed', False):
+            return
+        app._generic_handlers_installed = True
+
         @app.errorhandler(422)
         def handle_error(err):  # pylint: disable=unused-variable
             # webargs attaches additional metadata to the `data` attribute
@@ -430,6 +499,10 @@ class GenericView(FlaskView):
             return flask.jsonify(response), 500
 
 
+_workspace_by_name_query = bakery(lambda session: session.query(Workspace))
+_workspace_by_name_query += lambda query: query.filter(Workspace.name == bindparam('name'))
+
+
 class GenericWorkspacedView(GenericView):
     """Abstract class for a view that depends on the workspace, that is
     passed in the URL
@@ -447,19 +520,28 @@ class GenericWorkspacedView(GenericView):
 
     @staticmethod
     def _get_workspace(workspace_name):
-        ws = None
+        # The same workspace is resolved several times per request (before_request,
+        # base query, create/update), so it is kept in flask.g until the request ends
         try:
-            ws = Workspace.query.filter_by(name=workspace_name).one()
-            if not ws.active:
-                flask.abort(403, f"Disabled workspace: {workspace_name}")
-        except NoResultFound:
-            flask.abort(404, f"No such workspace: {workspace_name}")
+            ws = flask.g.workspaces[workspace_name]
+        except (KeyError, AttributeError):
+            try:
+                ws = _workspace_by_name_query(db.session()).params(name=workspace_name).one()
+            except NoResultFound:
+                flask.abort(404, f"No such workspace: {workspace_name}")
+            if hasattr(flask.g, 'workspaces'):
+                flask.g.workspaces[workspace_name] = ws
+        if not ws.active:
+            flask.abort(403, f"Disabled workspace: {workspace_name}")
         return ws
 
     def _get_base_query(self, workspace_name):
         base = super()._get_base_query()
-        return base.join(Workspace).filter(
-            Workspace.id == self._get_workspace(workspace_name).id)
+        workspace_id = self._get_workspace(workspace_name).id
+        if 'workspace_id' in get_model_attr_names(self.model_class):
+            # No need to join the workspace table to filter by its id
+            return base.filter(self.model_class.workspace_id == workspace_id)
+        return base.join(Workspace).filter(Workspace.id == workspace_id)
 
     def _get_object(self, object_id, workspace_name=None, eagerload=False, **kwargs):
         self._validate_object_id(object_id)
@@ -515,6 +597,12 @@ class ListMixin:
     #: query by default
     order_field = None
 
+    #: If set (to a list of SQLAlchemy column attributes), the list endpoint
+    #: will query only these columns and dump the resulting rows instead of
+    #: loading model instances. Only use it when every field of the schema
+    #: is a plain column listed here
+    list_columns = None
+
     def _envelope_list(self, objects, pagination_metadata=None):
         """Override this method to define how a list of objects is
         rendered.
@@ -557,7 +645,11 @@ class ListMixin:
                 application/json:
                   schema: {schema_class}
         """
-        query = self._filter_query(self._get_eagerloaded_query(**kwargs))
+        if self.list_columns:
+            query = self._filter_query(
+                self._get_base_query(**kwargs).with_entities(*self.list_columns))
+        else:
+            query = self._filter_query(self._get_eagerloaded_query(**kwargs))
         order_field = self._get_order_field(**kwargs)
         if order_field is not None:
             if isinstance(order_field, tuple):
@@ -567,6 +659,8 @@ class ListMixin:
         objects, pagination_metadata = self._paginate(query)
         if not isinstance(objects, list):
             objects = objects.limit(None).offset(0)
+        if self.list_columns:
+            objects = [row._asdict() for row in objects]
         return self._envelope_list(self._dump(objects, kwargs, many=True),
                                    pagination_metadata)
 
@@ -594,19 +688,21 @@ class SortableMixin:
         # Check that the field is in the schema to prevent unwanted fields
         # value leaking
         schema = self._get_schema_instance(kwargs)
+        # The schema instance may be shared, work on a copy of its fields
+        schema_fields = dict(schema.fields)
 
         # Add metadata nested field
         try:
-            metadata_field = schema.fields.pop('metadata')
+            metadata_field = schema_fields.pop('metadata')
         except KeyError:
             pass
         else:
             for (key, value) in metadata_field.target_schema.fields.items():
-                schema.fields['metadata.' + key] = value
-                schema.fields[key] = value
+                schema_fields['metadata.' + key] = value
+                schema_fields[key] = value
 
         try:
-            field_instance = schema.fields[order_field]
+            field_instance = schema_fields[order_field]
         except KeyError:
             if self.sort_pass_silently:
                 logger.warning(f"Unknown field: {order_field}")
@@ -619,7 +715,7 @@ class SortableMixin:
         # TODO migration: improve this checking or use a whitelist.
         # Handle PrimaryKeyRelatedField
         model_class = self.sort_model_class or self.model_class
-        if order_field not in inspect(model_class).attrs:
+        if order_field not in get_model_attr_names(model_class):
             if self.sort_pass_silently:
                 logger.warning(f"Field not in the DB: {order_field}")
                 return self.order_field
@@ -653,30 +749,101 @@ class SortableMixin:
             raise InvalidUsage(f"field {order_field} doesn't support sorting")
 
 
+class KeysetPagination:
+    """Pagination metadata returned when listing with a cursor.
+
+    ``total`` is only computed when explicitly requested, and
+    ``next_cursor`` is None when there are no more pages.
+    """
+
+    def __init__(self, items, per_page, next_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.total = total
+
+
 class PaginatedMixin:
-    """Add pagination for list route"""
+    """Add pagination for list route
+
+    Besides the classic ``page``/``page_size`` pagination, a ``cursor``
+    parameter can be sent to page by the lookup field instead of using
+    OFFSET, which keeps the cost of deep pages constant. Send an empty
+    cursor to get the first page and the ``next_cursor`` of the response
+    to get the next one. The COUNT query is skipped unless ``with_total``
+    is set, so in this mode the envelopes leave out their count when it
+    wasn't requested.
+    """
     per_page_parameter_name = 'page_size'
     page_number_parameter_name = 'page'
-
-    def _paginate(self, query):
-        page, per_page = None, None
-        if self.per_page_parameter_name in flask.request.args:
-
+    cursor_parameter_name = 'cursor'
+    with_total_parameter_name = 'with_total'
+
+    def _paginate_by_cursor(self, query):
+        args = flask.request.args
+        sort_parameters = (getattr(self, 'sort_field_parameter_name', None),
+                           getattr(self, 'sort_direction_parameter_name', None))
+        if any(name in args for name in sort_parameters if name is not None):
+            # The cursor only works walking the lookup field in order
+            raise InvalidUsage("Cursor pagination can't be combined with sorting")
+        cursor = args[self.cursor_parameter_name] or None
+        lookup_field = self._get_lookup_field()
+        if cursor is not None:
             try:
-                page = int(flask.request.args.get(
-                    self.page_number_parameter_name, 1))
+                cursor = self.lookup_field_type(cursor)
             except (TypeError, ValueError):
-                flask.abort(404, 'Invalid page number')
+                flask.abort(404, 'Invalid cursor')
+        per_page = self._get_per_page()
+
+        total = None
+        if args.get(self.with_total_parameter_name, '').lower() in ('1', 'true'):
+            total = query.order_by(None).count()
+
+        query = query.order_by(None).order_by(lookup_field)
+        if cursor is not None:
+            query = query.filter(lookup_field > cursor)
+        if per_page is not None:
+            # Fetch one extra row to know if there is a next page
+            query = query.limit(per_page + 1)
+        items = query.all()
+
+        next_cursor = None
+        if per_page is not None and len(items) > per_page:
+            items = items[:per_page]
+            next_cursor = getattr(items[-1], self.lookup_field)
+        return items, KeysetPagination(items, per_page, next_cursor, total)
 
-            try:
-                per_page = int(flask.request.args[
-                                   self.per_page_parameter_name])
-            except (TypeError, ValueError):
-                flask.abort(404, 'Invalid per_page value')
+    @staticmethod
+    def _cursor_envelope(pagination_metadata):
+        """Return the keys that list envelopes add when paginating with
+        a cursor
+        """
+        if isinstance(pagination_metadata, KeysetPagination):
+            return {'next_cursor': pagination_metadata.next_cursor}
+        return {}
+
+    def _get_per_page(self):
+        """Return the requested page size, or None if it wasn't sent"""
+        args = flask.request.args
+        per_page = args.get(self.per_page_parameter_name, type=int)
+        if per_page is None and self.per_page_parameter_name in args:
+            flask.abort(404, 'Invalid per_page value')
+        return per_page
 
-            pagination_metadata = query.paginate(page=page, per_page=per_page, error_out=False)
-            return pagination_metadata.items, pagination_metadata
-        return super()._paginate(query)
+    def _paginate(self, query):
+        args = flask.request.args
+        if self.cursor_parameter_name in args:
+            return self._paginate_by_cursor(query)
+        per_page = self._get_per_page()
+        if per_page is None:
+            return super()._paginate(query)
+        page = args.get(self.page_number_parameter_name, type=int)
+        if page is None:
+            if self.page_number_parameter_name in args:
+                flask.abort(404, 'Invalid page number')
+            page = 1
+        pagination_metadata = query.paginate(page=page, per_page=per_page, error_out=False)
+        return pagination_metadata.items, pagination_metadata
 
 
 class FilterAlchemyMixin:
@@ -1044,7 +1211,8 @@ class CreateMixin:
         # assert not db.session.new
         try:
             db.session.add(obj)
-            db.session.commit()
+            # Flush to detect conflicts and get the id, post() commits
+            db.session.flush()
             logger.info(f"{obj} created")
         except sqlalchemy.exc.IntegrityError as ex:
             logger.info(f"Couldn't create {obj}")
@@ -1152,14 +1320,18 @@ class CreateWorkspacedMixin(CreateMixin, CommandMixin):
         return super().post(workspace_name=workspace_name)
 
     def _perform_create(self, data, workspace_name):
-        assert not db.session.new
+        if __debug__ and flask.current_app.testing:
+            # Only check for uncommitted objects while testing, it walks the
+            # whole session on every create
+            assert not db.session.new
         workspace = self._get_workspace(workspace_name)
         obj = self.model_class(**data)
         obj.workspace = workspace
         # assert not db.session.new
         try:
             db.session.add(obj)
-            db.session.commit()
+            # Flush to detect conflicts and get the id, post() commits
+            db.session.flush()
             logger.info(f"{obj} created")
         except sqlalchemy.exc.IntegrityError as ex:
             logger.info(f"Couldn't create {obj}")
@@ -1645,10 +1817,9 @@ class CountWorkspacedMixin:
         group_by, sort_dir = get_group_by_and_sort_dir(self.model_class)
 
         workspace_name = kwargs.pop('workspace_name')
-        # using format is not a great practice.
-        # the user input is group_by, however it's filtered by column name.
-        table_name = inspect(self.model_class).tables[0].name
-        group_by = f'{table_name}.{group_by}'
+        # the user input is group_by, it was already checked to be a
+        # mapped attribute of the model
+        group_by = getattr(self.model_class, group_by)
 
         count = self._filter_query(
             db.session.query(self.model_class).
@@ -1663,15 +1834,16 @@ class CountWorkspacedMixin:
             count = count.order_by(desc(order_by))
         else:
             count = count.order_by(asc(order_by))
-        for key, count in count.values(group_by, func.count(group_by)):
+        groups = count.with_entities(group_by, func.count(group_by)).all()
+        for key, group_count in groups:
             res['groups'].append(
-                {'count': count,
+                {'count': group_count,
                  'name': key,
                  # To add compatibility with the web ui
                  flask.request.args.get('group_by'): key,
                  }
             )
-            res['total_count'] += count
+        res['total_count'] = sum(group_count for _, group_count in groups)
         return res
 
 
@@ -102,6 +102,7 @@ class ActivityFeedView(PaginatedMixin, ReadWriteWorkspacedView):
             })
         return {
             'activities': commands,
+            **self._cursor_envelope(pagination_metadata),
         }
 
 
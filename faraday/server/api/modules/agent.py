@@ -124,7 +124,8 @@ class AgentView(ReadWriteView):
     route_base = 'agents'
     model_class = Agent
     schema_class = AgentSchema
-    get_joinedloads = [Agent.creator, Agent.executors]
+    get_joinedloads = [Agent.creator]
+    get_selectinloads = [Agent.executors]
 
     @staticmethod
     def _get_workspace(workspace_name):
@@ -229,7 +230,7 @@ class AgentView(ReadWriteView):
                 db.session.add(agent_execution)
             db.session.commit()
 
-            changes_queue.put({
+            changes_queue.append({
                 'execution_ids': [agent_execution.id for agent_execution in agent_executions],
                 'agent_id': agent.id,
                 'workspaces': [workspace.name for workspace in workspaces],
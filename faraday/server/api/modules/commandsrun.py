@@ -101,6 +101,7 @@ class CommandView(PaginatedMixin, ReadWriteWorkspacedView):
             })
         return {
             'commands': commands,
+            **self._cursor_envelope(pagination_metadata),
         }
 
     @route('/activity_feed')
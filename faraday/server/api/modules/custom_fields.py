@@ -45,6 +45,9 @@ class CustomFieldsSchemaView(ReadWriteView, BulkDeleteMixin):
     route_base = 'custom_fields_schema'
     model_class = CustomFieldsSchema
     schema_class = CustomFieldsSchemaSchema
+    # Every field of the schema is a column with the same name
+    list_columns = [getattr(CustomFieldsSchema, field_name)
+                    for field_name in CustomFieldsSchemaSchema.Meta.fields]
 
     @staticmethod
     def _check_post_only_data(data):
@@ -155,7 +155,8 @@ class HostsView(PaginatedMixin,
     get_undefer = [Host.credentials_count,
                    Host.open_service_count,
                    Host.vulnerability_count]
-    get_joinedloads = [Host.hostnames, Host.services, Host.update_user]
+    get_joinedloads = [Host.update_user]
+    get_selectinloads = [Host.hostnames, Host.services]
 
     def _get_base_query(self, workspace_name):
         return Host.query_with_count(None, None, workspace_name)
@@ -360,7 +361,6 @@ class HostsView(PaginatedMixin,
         for name in hostnames:
             get_or_create(db.session, Hostname, name=name, host=host,
                           workspace=host.workspace)
-        db.session.commit()
         return host
 
     def _update_object(self, obj, data, **kwargs):
@@ -402,10 +402,15 @@ class HostsView(PaginatedMixin,
                 'key': host.get('_id', index),
                 'value': host
             })
-        return {
+        envelope = {
             'rows': hosts,
-            'count': (pagination_metadata and pagination_metadata.total or len(hosts)),
+            **self._cursor_envelope(pagination_metadata),
         }
+        if pagination_metadata is None:
+            envelope['count'] = len(hosts)
+        elif pagination_metadata.total is not None:
+            envelope['count'] = pagination_metadata.total
+        return envelope
 
     @route('', methods=['DELETE'])
     def bulk_delete(self, workspace_name, **kwargs):
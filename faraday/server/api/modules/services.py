@@ -129,7 +129,8 @@ class ServiceView(FilterAlchemyMixin, ReadWriteWorkspacedView, BulkDeleteWorkspa
     schema_class = ServiceSchema
     count_extra_filters = [Service.status == 'open']
     get_undefer = [Service.credentials_count, Service.vulnerability_count]
-    get_joinedloads = [Service.credentials, Service.update_user]
+    get_joinedloads = [Service.update_user]
+    get_selectinloads = [Service.credentials]
     filterset_class = ServiceFilterSet
 
     def _envelope_list(self, objects, pagination_metadata=None):
@@ -167,7 +167,8 @@ class VulnerabilityTemplateView(PaginatedMixin,
             })
         return {
             'rows': vuln_tpls,
-            'total_rows': len(objects)
+            'total_rows': len(objects),
+            **self._cursor_envelope(pagination_metadata),
         }
 
     def post(self, **kwargs):
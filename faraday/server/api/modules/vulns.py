@@ -542,7 +542,6 @@ class VulnerabilityView(PaginatedMixin,
                 obj.tool = obj.creator_command_tool
             else:
                 obj.tool = "Web UI"
-        db.session.commit()
         return obj
 
     @staticmethod
@@ -663,11 +662,15 @@ class VulnerabilityView(PaginatedMixin,
                 'key': vuln.get('_id', index),
                 'value': vuln
             })
-        return {
+        envelope = {
             'vulnerabilities': vulns,
-            'count': (pagination_metadata.total
-                      if pagination_metadata is not None else len(vulns))
+            **self._cursor_envelope(pagination_metadata),
         }
+        count = (pagination_metadata.total
+                 if pagination_metadata is not None else len(vulns))
+        if count is not None:
+            envelope['count'] = count
+        return envelope
 
     def count(self, **kwargs):
         """
@@ -463,8 +463,6 @@ class WorkspaceView(ReadWriteView, FilterMixin, BulkDeleteMixin):
         scope = data.pop('scope', [])
         workspace = super()._perform_create(data, **kwargs)
         workspace.set_scope(scope)
-
-        db.session.commit()
         return workspace
 
     def _update_object(self, obj, data, **kwargs):
@@ -25,6 +25,7 @@ import flask_login
 from flask import Flask, session, g, request
 from flask.json import JSONEncoder
 from flask_sqlalchemy import get_debug_queries
+from sqlalchemy.engine.url import make_url
 from flask_security import (
     Security,
     SQLAlchemyUserDatastore,
@@ -146,6 +147,21 @@ def check_testing_configuration(testing, app):
         NPlusOne(app)
 
 
+def get_engine_options(connection_string):
+    database = faraday.server.config.database
+    options = {
+        'pool_pre_ping': True,
+        'pool_recycle': database.pool_recycle,
+    }
+    # sqlite uses a SingletonThreadPool/StaticPool that can't be sized. The
+    # dialect name is used because the backend name of postgres:// URIs is
+    # "postgres"
+    if connection_string and make_url(connection_string).get_dialect().name == 'postgresql':
+        options['pool_size'] = database.pool_size
+        options['max_overflow'] = database.max_overflow
+    return options
+
+
 def register_handlers(app):
     # We are exposing a RESTful API, so don't redirect a user to a login page in
     # case of being unauthorized, raise a 403 error instead
@@ -213,6 +229,10 @@ def register_handlers(app):
     def load_g_custom_fields():  # pylint:disable=unused-variable
         g.custom_fields = {}
 
+    @app.before_request
+    def load_g_workspaces():  # pylint:disable=unused-variable
+        g.workspaces = {}
+
     @app.after_request
     def log_queries_count(response):  # pylint:disable=unused-variable
         if flask.request.method not in ['GET', 'HEAD']:
@@ -410,6 +430,8 @@ def create_app(db_connection_string=None, testing=None):
         logger.info(
             'Missing connection_string on [database] section on server.ini. Please configure the database before running the server.')
 
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options(app.config.get('SQLALCHEMY_DATABASE_URI'))
+
     from faraday.server.models import db  # pylint:disable=import-outside-toplevel
     db.init_app(app)
     # Session(app)
@@ -120,6 +120,9 @@ class ConfigSection:
 class DatabaseConfigObject(ConfigSection):
     def __init__(self):
         self.connection_string = None
+        self.pool_size = 5
+        self.max_overflow = 10
+        self.pool_recycle = 3600
 
 
 class LimiterConfigObject(ConfigSection):
@@ -4,16 +4,15 @@ Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
 See the file 'doc/LICENSE' for the license information
 
 """
-import sys
 import logging
-import inspect
+from collections import deque
 from datetime import date
-from queue import Queue
 
-from sqlalchemy import event
-from sqlalchemy.dialects import postgresql
+from sqlalchemy import Date, Integer, bindparam, event, inspect, text
 from sqlalchemy.orm import Query
-from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.orm.attributes import get_history, PASSIVE_NO_INITIALIZE
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import BindParameter
 
 from faraday.server.models import (
     Host,
@@ -29,7 +28,39 @@ from faraday.server.models import (
 from faraday.server.models import db
 
 logger = logging.getLogger(__name__)
-changes_queue = Queue()
+changes_queue = deque()
+
+_SEVERITIES_ALLOWED = frozenset(SeveritiesHistogram.SEVERITIES_ALLOWED)
+_OPEN_STATUSES = frozenset((Vulnerability.STATUS_OPEN, Vulnerability.STATUS_RE_OPENED))
+_CLOSED_STATUSES = frozenset((Vulnerability.STATUS_CLOSED, Vulnerability.STATUS_RISK_ACCEPTED))
+
+# (medium, high, critical) deltas for each severity tracked by the histogram
+_SEVERITY_INCREASE = {
+    Vulnerability.SEVERITY_MEDIUM: (1, 0, 0),
+    Vulnerability.SEVERITY_HIGH: (0, 1, 0),
+    Vulnerability.SEVERITY_CRITICAL: (0, 0, 1),
+}
+_SEVERITY_DECREASE = {severity: tuple(-delta for delta in deltas) for severity, deltas in _SEVERITY_INCREASE.items()}
+_NO_SEVERITY_DELTA = (0, 0, 0)
+_HISTOGRAM_ATTRIBUTES = ('status', 'confirmed', 'severity')
+
+# Built once and reused with bound parameters on every histogram change
+_UPSERT_HISTOGRAM = text(
+    "INSERT INTO severities_histogram (workspace_id, date, medium, high, critical, confirmed) "
+    "VALUES (:workspace_id, :date, :medium, :high, :critical, :confirmed) "
+    "ON CONFLICT (workspace_id, date) DO UPDATE "
+    "SET medium = severities_histogram.medium + excluded.medium, "
+    "high = severities_histogram.high + excluded.high, "
+    "critical = severities_histogram.critical + excluded.critical, "
+    "confirmed = severities_histogram.confirmed + excluded.confirmed"
+).bindparams(
+    bindparam('workspace_id', type_=Integer),
+    bindparam('date', type_=Date),
+    bindparam('medium', type_=Integer),
+    bindparam('high', type_=Integer),
+    bindparam('critical', type_=Integer),
+    bindparam('confirmed', type_=Integer),
+)
 
 
 def new_object_event(mapper, connection, instance):
@@ -46,7 +77,7 @@ def new_object_event(mapper, connection, instance):
         'name': name,
         'workspace': instance.workspace.name
     }
-    changes_queue.put(msg)
+    changes_queue.append(msg)
 
 
 def delete_object_event(mapper, connection, instance):
@@ -61,19 +92,23 @@ def delete_object_event(mapper, connection, instance):
         'name': name,
         'workspace': instance.workspace.name
     }
-    db.session.query(TagObject).filter_by(
-        object_id=instance.id,
-        object_type=msg['type'].lower(),
-    ).delete()
-    db.session.query(Comment).filter_by(
-        object_id=instance.id,
-        object_type=msg['type'].lower(),
-    ).delete()
-    db.session.query(File).filter_by(
-        object_id=instance.id,
-        object_type=msg['type'].lower(),
-    ).delete()
-    changes_queue.put(msg)
+    if connection.dialect.name == 'postgresql':
+        # One round trip instead of three, all deletes share the same filter
+        connection.execute(
+            text("WITH deleted_tags AS ("
+                 "DELETE FROM tag_object WHERE object_id = :object_id AND object_type = :object_type), "
+                 "deleted_comments AS ("
+                 "DELETE FROM comment WHERE object_id = :object_id AND object_type = :object_type) "
+                 "DELETE FROM file WHERE object_id = :object_id AND object_type = :object_type"),
+            {'object_id': instance.id, 'object_type': msg['type'].lower()}
+        )
+    else:
+        for model in (TagObject, Comment, File):
+            db.session.query(model).filter_by(
+                object_id=instance.id,
+                object_type=msg['type'].lower(),
+            ).delete()
+    changes_queue.append(msg)
 
 
 def update_object_event(mapper, connection, instance):
@@ -90,16 +125,12 @@ def update_object_event(mapper, connection, instance):
         'name': name,
         'workspace': instance.workspace.name
     }
-    changes_queue.put(msg)
+    changes_queue.append(msg)
 
 
 def after_insert_check_child_has_same_workspace(mapper, connection, inserted_instance):
     if inserted_instance.parent:
-        assert (inserted_instance.workspace
-                == inserted_instance.parent.workspace), \
-                "Conflicting workspace assignation for objects. " \
-                "This should never happen!!!"
-
+        # Compare the foreign keys only, accessing parent.workspace would lazy load the workspace
         assert (inserted_instance.workspace_id
                 == inserted_instance.parent.workspace_id), \
                 "Conflicting workspace_id assignation for objects. " \
@@ -110,42 +141,55 @@ def _create_or_update_histogram(connection, workspace_id=None, medium=0, high=0,
     if workspace_id is None:
         logger.error("Workspace with None value. Histogram could not be updated")
         return
-    ws_id = SeveritiesHistogram.query.with_entities('id').filter(
-        SeveritiesHistogram.date == date.today(),
-        SeveritiesHistogram.workspace_id == workspace_id).first()
-    if ws_id is None:
-        connection.execute(
-            f"INSERT "  # nosec
-            f"INTO severities_histogram (workspace_id, medium, high, critical, date, confirmed) "
-            f"VALUES ({workspace_id}, {medium}, {high}, {critical}, '{date.today()}', {confirmed})")
-    else:
-        connection.execute(
-            f"UPDATE severities_histogram "  # nosec
-            f"SET medium = medium + {medium}, "
-            f"high = high + {high}, "
-            f"critical = critical + {critical}, "
-            f"confirmed = confirmed + {confirmed} "
-            f"WHERE id = {ws_id[0]}")
+    connection.execute(
+        _UPSERT_HISTOGRAM,
+        {
+            'workspace_id': workspace_id,
+            'date': date.today(),
+            'medium': medium,
+            'high': high,
+            'critical': critical,
+            'confirmed': confirmed,
+        }
+    )
+
+
+def _accumulate_histogram(counters, workspace_id, *, medium=0, high=0, critical=0, confirmed=0):
+    """Add the histogram deltas of ``workspace_id`` to ``counters``, so
+    bulk operations write them once per workspace with
+    ``_flush_histogram_counters``
+    """
+    if workspace_id is None:
+        logger.error("Workspace with None value. Histogram could not be updated")
+        return
+    counters[workspace_id] = tuple(map(sum, zip(counters.get(workspace_id, (0,) * 4),
+                                                (medium, high, critical, confirmed))))
+
+
+def _flush_histogram_counters(connection, counters):
+    for workspace_id, (medium, high, critical, confirmed) in counters.items():
+        _create_or_update_histogram(connection,
+                                    workspace_id,
+                                    medium=medium,
+                                    high=high,
+                                    critical=critical,
+                                    confirmed=confirmed)
 
 
 def _dicrease_severities_histogram(instance_severity, medium=0, high=0, critical=0):
-    medium = -1 if instance_severity == Vulnerability.SEVERITY_MEDIUM else medium
-    high = -1 if instance_severity == Vulnerability.SEVERITY_HIGH else high
-    critical = -1 if instance_severity == Vulnerability.SEVERITY_CRITICAL else critical
+    medium_delta, high_delta, critical_delta = _SEVERITY_DECREASE.get(instance_severity, _NO_SEVERITY_DELTA)
 
-    return medium, high, critical
+    return medium + medium_delta, high + high_delta, critical + critical_delta
 
 
 def _increase_severities_histogram(instance_severity, medium=0, high=0, critical=0):
-    medium = 1 if instance_severity == Vulnerability.SEVERITY_MEDIUM else medium
-    high = 1 if instance_severity == Vulnerability.SEVERITY_HIGH else high
-    critical = 1 if instance_severity == Vulnerability.SEVERITY_CRITICAL else critical
+    medium_delta, high_delta, critical_delta = _SEVERITY_INCREASE.get(instance_severity, _NO_SEVERITY_DELTA)
 
-    return medium, high, critical
+    return medium + medium_delta, high + high_delta, critical + critical_delta
 
 
 def alter_histogram_on_insert(mapper, connection, instance):
-    if instance.severity in SeveritiesHistogram.SEVERITIES_ALLOWED:
+    if instance.severity in _SEVERITIES_ALLOWED:
         medium, high, critical = _increase_severities_histogram(instance.severity)
         confirmed = 1 if instance.confirmed else 0
 
@@ -158,15 +202,29 @@ def alter_histogram_on_insert(mapper, connection, instance):
 
 
 def alter_histogram_on_update(mapper, connection, instance):
+    # Most updates don't touch the histogram fields, skip them before building any history
+    instance_attrs = inspect(instance).attrs
+    if not any(instance_attrs[attr].history.has_changes() for attr in _HISTOGRAM_ATTRIBUTES):
+        return
+    # Never emit a SELECT for the old values, unloaded attributes give an empty history
     alter_histogram_on_update_general(connection,
                                       instance.workspace_id,
-                                      status_history=get_history(instance, 'status'),
-                                      confirmed_history=get_history(instance, 'confirmed'),
-                                      severity_history=get_history(instance, 'severity'))
+                                      status_history=get_history(instance, 'status',
+                                                                 passive=PASSIVE_NO_INITIALIZE),
+                                      confirmed_history=get_history(instance, 'confirmed',
+                                                                    passive=PASSIVE_NO_INITIALIZE),
+                                      severity_history=get_history(instance, 'severity',
+                                                                   passive=PASSIVE_NO_INITIALIZE))
 
 
 def alter_histogram_on_update_general(connection, workspace_id, status_history=None,
                                       confirmed_history=None, severity_history=None):
+    counters = {}
+    _accumulate_histogram_update(counters, workspace_id, status_history, confirmed_history, severity_history)
+    _flush_histogram_counters(connection, counters)
+
+
+def _accumulate_histogram_update(counters, workspace_id, status_history, confirmed_history, severity_history):
 
     if not status_history or not confirmed_history or not severity_history:
         logger.error("Not all history fields provided")
@@ -191,59 +249,59 @@ def alter_histogram_on_update_general(connection, workspace_id, status_history=N
 
     if len(status_history.unchanged) > 0:
         if len(severity_history.unchanged) > 0:
-            if confirmed_counter != 0 and status_history.unchanged[0] in [Vulnerability.STATUS_OPEN, Vulnerability.STATUS_RE_OPENED]:
-                _create_or_update_histogram(connection, workspace_id, confirmed=confirmed_counter)
+            if confirmed_counter != 0 and status_history.unchanged[0] in _OPEN_STATUSES:
+                _accumulate_histogram(counters, workspace_id, confirmed=confirmed_counter)
             return
         medium = high = critical = 0
         if not severity_history.deleted or not severity_history.added:
-            if confirmed_counter != 0 and status_history.unchanged[0] in [Vulnerability.STATUS_OPEN, Vulnerability.STATUS_RE_OPENED]:
-                _create_or_update_histogram(connection, workspace_id, confirmed=confirmed_counter)
+            if confirmed_counter != 0 and status_history.unchanged[0] in _OPEN_STATUSES:
+                _accumulate_histogram(counters, workspace_id, confirmed=confirmed_counter)
             logger.error("Severity history deleted or added is None. Could not update severity histogram.")
             return
 
-        if severity_history.deleted[0] in SeveritiesHistogram.SEVERITIES_ALLOWED:
+        if severity_history.deleted[0] in _SEVERITIES_ALLOWED:
             medium, high, critical = _dicrease_severities_histogram(severity_history.deleted[0])
 
-        if severity_history.added[0] in SeveritiesHistogram.SEVERITIES_ALLOWED:
+        if severity_history.added[0] in _SEVERITIES_ALLOWED:
             medium, high, critical = _increase_severities_histogram(severity_history.added[0],
                                                                     medium=medium,
                                                                     high=high,
                                                                     critical=critical)
-        _create_or_update_histogram(connection,
-                                    workspace_id,
-                                    medium=medium,
-                                    high=high,
-                                    critical=critical,
-                                    confirmed=confirmed_counter)
-
-    elif status_history.added[0] in [Vulnerability.STATUS_CLOSED, Vulnerability.STATUS_RISK_ACCEPTED]\
-            and status_history.deleted[0] in [Vulnerability.STATUS_OPEN, Vulnerability.STATUS_RE_OPENED]:
+        _accumulate_histogram(counters,
+                              workspace_id,
+                              medium=medium,
+                              high=high,
+                              critical=critical,
+                              confirmed=confirmed_counter)
+
+    elif status_history.added[0] in _CLOSED_STATUSES\
+            and status_history.deleted[0] in _OPEN_STATUSES:
         if len(severity_history.unchanged) > 0:
             severity = severity_history.unchanged[0]
         if len(severity_history.deleted) > 0:
             severity = severity_history.deleted[0]
-        if severity in SeveritiesHistogram.SEVERITIES_ALLOWED:
+        if severity in _SEVERITIES_ALLOWED:
             medium, high, critical = _dicrease_severities_histogram(severity)
-            _create_or_update_histogram(connection, workspace_id, medium=medium, high=high,
-                                        critical=critical, confirmed=confirmed_counter_on_close)
-    elif status_history.added[0] in [Vulnerability.STATUS_OPEN, Vulnerability.STATUS_RE_OPENED] \
-            and status_history.deleted[0] in [Vulnerability.STATUS_CLOSED, Vulnerability.STATUS_RISK_ACCEPTED]:
+            _accumulate_histogram(counters, workspace_id, medium=medium, high=high,
+                                  critical=critical, confirmed=confirmed_counter_on_close)
+    elif status_history.added[0] in _OPEN_STATUSES \
+            and status_history.deleted[0] in _CLOSED_STATUSES:
         if len(severity_history.unchanged) > 0:
             severity = severity_history.unchanged[0]
         if len(severity_history.added) > 0:
             severity = severity_history.added[0]
-        if severity in SeveritiesHistogram.SEVERITIES_ALLOWED:
+        if severity in _SEVERITIES_ALLOWED:
             medium, high, critical = _increase_severities_histogram(severity)
-            _create_or_update_histogram(connection, workspace_id, medium=medium, high=high,
-                                        critical=critical, confirmed=confirmed_counter_on_reopen)
+            _accumulate_histogram(counters, workspace_id, medium=medium, high=high,
+                                  critical=critical, confirmed=confirmed_counter_on_reopen)
     elif confirmed_counter != 0:
-        _create_or_update_histogram(connection, workspace_id, confirmed=confirmed_counter)
+        _accumulate_histogram(counters, workspace_id, confirmed=confirmed_counter)
 
 
 def alter_histogram_on_delete(mapper, connection, instance):
-    if instance.status in [Vulnerability.STATUS_OPEN, Vulnerability.STATUS_RE_OPENED]:
+    if instance.status in _OPEN_STATUSES:
         confirmed = -1 if instance.confirmed is True else 0
-        if instance.severity in SeveritiesHistogram.SEVERITIES_ALLOWED:
+        if instance.severity in _SEVERITIES_ALLOWED:
             medium, high, critical = _dicrease_severities_histogram(instance.severity)
             _create_or_update_histogram(connection, instance.workspace_id,
                                         medium=medium,
@@ -257,17 +315,24 @@ def alter_histogram_on_before_compile_delete(query, delete_context):
         if desc['type'] is Vulnerability or \
             desc['type'] is VulnerabilityGeneric or\
                 desc['type'] is VulnerabilityWeb:
-            instances = query.all()
-            for instance in instances:
-                if instance.status in [Vulnerability.STATUS_OPEN, Vulnerability.STATUS_RE_OPENED]:
-                    if instance.severity in SeveritiesHistogram.SEVERITIES_ALLOWED:
-                        medium, high, critical = _dicrease_severities_histogram(instance.severity)
-                        _create_or_update_histogram(delete_context.session,
-                                                    instance.workspace_id,
-                                                    medium=medium,
-                                                    high=high,
-                                                    critical=critical,
-                                                    confirmed=-1 if instance.confirmed is True else 0)
+            counters = {}
+            # Only the histogram columns are needed, avoid loading full instances
+            vuln_class = desc['type']
+            rows = query.with_entities(vuln_class.status,
+                                       vuln_class.severity,
+                                       vuln_class.confirmed,
+                                       vuln_class.workspace_id).all()
+            for row in rows:
+                if row.status in _OPEN_STATUSES:
+                    if row.severity in _SEVERITIES_ALLOWED:
+                        medium, high, critical = _dicrease_severities_histogram(row.severity)
+                        _accumulate_histogram(counters,
+                                              row.workspace_id,
+                                              medium=medium,
+                                              high=high,
+                                              critical=critical,
+                                              confirmed=-1 if row.confirmed is True else 0)
+            _flush_histogram_counters(delete_context.session, counters)
 
 
 def get_history_from_context_values(context_values, field, old_value):
@@ -280,13 +345,30 @@ def get_history_from_context_values(context_values, field, old_value):
     return field_history
 
 
+def _get_id_params(whereclause):
+    # Walk the comparisons against the vulnerability id column instead of
+    # compiling the whole statement
+    if whereclause is None:
+        return []
+    ids = []
+
+    def visit_binary(binary):
+        column = binary.left
+        if getattr(column, 'table', None) is VulnerabilityGeneric.__table__ \
+                and column.name == 'id':
+            ids.extend(element.value for element in visitors.iterate(binary.right, {})
+                       if isinstance(element, BindParameter))
+
+    visitors.traverse(whereclause, {}, {'binary': visit_binary})
+    return ids
+
+
 def alter_histogram_on_before_compile_update(query, update_context):
     for desc in query.column_descriptions:
         if desc['type'] is Vulnerability or \
             desc['type'] is VulnerabilityGeneric or\
                 desc['type'] is VulnerabilityWeb:
-            ids = [x[1] for x in filter(lambda x: x[0].startswith("id_"),
-                                        query.statement.compile(dialect=postgresql.dialect()).params.items())]
+            ids = _get_id_params(query.whereclause)
             if ids:
                 # this can arise some issues with counters when other filters were applied to query but...
                 instances = update_context.session.query(VulnerabilityGeneric).filter(
@@ -294,22 +376,25 @@ def alter_histogram_on_before_compile_update(query, update_context):
             else:
                 instances = query.all()
 
+            counters = {}
             for instance in instances:
                 status_history = get_history_from_context_values(update_context.values, 'status', instance.status)
                 severity_history = get_history_from_context_values(update_context.values, 'severity', instance.severity)
                 confirmed_history = get_history_from_context_values(update_context.values, 'confirmed',
                                                                     instance.confirmed)
 
-                alter_histogram_on_update_general(update_context.session,
-                                                  instance.workspace_id,
-                                                  status_history=status_history,
-                                                  confirmed_history=confirmed_history,
-                                                  severity_history=severity_history)
+                _accumulate_histogram_update(counters,
+                                             instance.workspace_id,
+                                             status_history,
+                                             confirmed_history,
+                                             severity_history)
+            _flush_histogram_counters(update_context.session, counters)
 
 
 # register the workspace verification for all objs that has workspace_id
-for name, obj in inspect.getmembers(sys.modules['faraday.server.models']):
-    if inspect.isclass(obj) and getattr(obj, 'workspace_id', None):
+for obj in db.Model._decl_class_registry.values():
+    # the registry also holds module markers, only mapped classes are relevant
+    if isinstance(obj, type) and 'workspace_id' in inspect(obj).columns:
         event.listen(obj, 'after_insert', after_insert_check_child_has_same_workspace)
         event.listen(obj, 'after_update', after_insert_check_child_has_same_workspace)
 
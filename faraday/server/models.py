@@ -551,6 +551,10 @@ class SeveritiesHistogram(db.Model):
     critical = Column(Integer, nullable=False)
     confirmed = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        UniqueConstraint(workspace_id, date, name='uix_severities_histogram_workspace_date'),
+    )
+
     # This method is required by event :_(
     @property
     def parent(self):
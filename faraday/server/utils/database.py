@@ -4,7 +4,7 @@
 from functools import reduce
 
 import operator
-from sqlalchemy import distinct, Boolean
+from sqlalchemy import distinct, Boolean, or_, case
 from sqlalchemy.sql import func, asc, desc
 from sqlalchemy.sql.expression import ClauseElement
 from sqlalchemy.sql import expression
@@ -253,6 +253,21 @@ def get_unique_fields(session, instance):
 
 
 def get_conflict_object(session, obj, data, workspace=None):
+    # The conditions of every unique constraint are OR'ed together so the
+    # conflicting object is fetched with a single query. Rows matching an
+    # earlier constraint are preferred, so the result doesn't depend on the
+    # order the database returns them
+    if get_object_type_for(obj) == 'vulnerability':
+        # This is a special key due to model inheritance
+        from faraday.server.models import VulnerabilityGeneric  # pylint:disable=import-outside-toplevel
+        klass = VulnerabilityGeneric
+    else:
+        klass = obj.__class__
+
+    table = klass.__table__
+    assert (klass is not None and table is not None)
+
+    constraints_filters = []
     unique_fields_gen = get_unique_fields(session, obj)
     for unique_fields in unique_fields_gen:
         relations_fields = list(filter(
@@ -262,16 +277,6 @@ def get_conflict_object(session, obj, data, workspace=None):
             lambda unique_field: not unique_field.endswith('_id'),
             unique_fields))
 
-        if get_object_type_for(obj) == 'vulnerability':
-            # This is a special key due to model inheritance
-            from faraday.server.models import VulnerabilityGeneric  # pylint:disable=import-outside-toplevel
-            klass = VulnerabilityGeneric
-        else:
-            klass = obj.__class__
-
-        table = klass.__table__
-        assert (klass is not None and table is not None)
-
         filter_data = []
         for unique_field in unique_fields:
             column = table.columns[unique_field]
@@ -301,10 +306,13 @@ def get_conflict_object(session, obj, data, workspace=None):
                         table.columns[relations_field] == relation_id)
 
         if filter_data:
-            filter_data = reduce(operator.and_, filter_data)
-            return session.query(klass).filter(filter_data).first()
-        else:
-            return
+            constraints_filters.append(reduce(operator.and_, filter_data))
+
+    if constraints_filters:
+        constraint_order = case([(constraint_filter, index)
+                                 for index, constraint_filter in enumerate(constraints_filters)])
+        return session.query(klass).filter(or_(*constraints_filters))\
+            .order_by(constraint_order).first()
 
 
 UNIQUE_VIOLATION = '23505'
@@ -10,7 +10,6 @@ import itsdangerous
 
 import http.cookies
 from collections import defaultdict
-from queue import Empty
 
 import txaio
 
@@ -206,9 +205,9 @@ class WorkspaceServerFactory(WebSocketServerFactory):
             broadcast method knowns each client workspace.
         """
         try:
-            msg = changes_queue.get_nowait()
+            msg = changes_queue.popleft()
             self.broadcast(json.dumps(msg))
-        except Empty:
+        except IndexError:
             pass
         reactor.callLater(0.5, self.tick)
 
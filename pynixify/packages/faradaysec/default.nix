@@ -34,6 +34,7 @@
 , marshmallow
 , marshmallow-sqlalchemy
 , nplusone
+, orjson
 , pgcli
 , pillow
 , psycopg2
@@ -123,6 +124,7 @@ buildPythonPackage rec {
       flask-limiter
       flask_mail
       faraday-agent-parameters-types
+      orjson
     ];
   checkInputs =
     [
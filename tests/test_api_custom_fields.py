@@ -36,6 +36,14 @@ class TestVulnerabilityCustomFields(ReadWriteAPITests, BulkDeleteTestsMixin):
                 'field_name': 'cvss', 'field_display_name': 'CVSS', 'field_metadata': None,
                 'field_order': 1} in res.json
 
+    def test_list_and_retrieve_return_the_same_fields(self, test_client):
+        res = test_client.get(self.url())
+        assert res.status_code == 200
+        listed = res.json[0]
+        res = test_client.get(self.url(listed['id']))
+        assert res.status_code == 200
+        assert res.json == listed
+
     def test_custom_fields_field_name_cant_be_changed(self, session, test_client):
         add_text_field = CustomFieldsSchemaFactory.create(
             table_name='vulnerability',
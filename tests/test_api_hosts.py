@@ -89,6 +89,27 @@ class TestHostAPI:
         assert res.status_code == 200
         assert len(res.json['rows']) == HOSTS_COUNT
 
+    def test_list_with_cursor(self, test_client):
+        ids = []
+        cursor = ''
+        while cursor is not None:
+            res = test_client.get(urljoin(self.url(), '?' + urlencode({'cursor': cursor, 'page_size': 2})))
+            assert res.status_code == 200
+            assert 'count' not in res.json
+            ids += [host['id'] for host in res.json['rows']]
+            cursor = res.json['next_cursor']
+        assert ids == sorted(host.id for host in self.hosts)
+
+        res = test_client.get(urljoin(self.url(), '?' + urlencode({'cursor': '', 'page_size': 2, 'with_total': 'true'})))
+        assert res.status_code == 200
+        assert res.json['count'] == HOSTS_COUNT
+        assert res.json['next_cursor'] == res.json['rows'][-1]['id']
+
+        res = test_client.get(urljoin(self.url(), '?' + urlencode({'cursor': '', 'page_size': HOSTS_COUNT})))
+        assert res.status_code == 200
+        assert len(res.json['rows']) == HOSTS_COUNT
+        assert res.json['next_cursor'] is None
+
     def test_retrieve_one_host(self, test_client, database):
         host = self.workspace.hosts[0]
         assert host.id is not None
@@ -1199,3 +1220,14 @@ def test_hypothesis(host_with_hostnames, test_client, session):
         assert res.status_code in [201, 400, 409]
 
     send_api_request()
+
+
+def test_schema_context_is_not_shared_between_workspaces(app, workspace, second_workspace):
+    view = HostsView()
+    with app.test_request_context():
+        first = view._get_schema_instance({'workspace_name': workspace.name})
+        second = view._get_schema_instance({'workspace_name': second_workspace.name})
+        assert view._get_schema_instance({}) is view._get_schema_instance({})
+    assert first is not second
+    assert first.context == {'workspace_name': workspace.name}
+    assert second.context == {'workspace_name': second_workspace.name}
@@ -79,6 +79,20 @@ class PaginationTestsMixin:
         assert res.status_code == 200
         assert res.json == {'data': []}
 
+    @pytest.mark.usefixtures('pagination_test_logic')
+    @pytest.mark.pagination
+    def test_does_not_allow_invalid_page_number(self, session, test_client):
+        self.create_many_objects(session, 5)
+        res = test_client.get(self.page_url('abc', 2))
+        assert res.status_code == 404
+
+    @pytest.mark.usefixtures('pagination_test_logic')
+    @pytest.mark.pagination
+    def test_does_not_allow_invalid_per_page(self, session, test_client):
+        self.create_many_objects(session, 5)
+        res = test_client.get(self.page_url(1, 'abc'))
+        assert res.status_code == 404
+
     @pytest.mark.usefixtures('pagination_test_logic')
     @pytest.mark.pagination
     def test_pages_have_different_elements(self, session, test_client):
@@ -109,3 +123,53 @@ class PaginationTestsMixin:
         res = test_client.get(self.page_url(1, 5))
         assert res.status_code == 200
         assert len(res.json['data']) == 0
+
+    @pytest.mark.usefixtures('pagination_test_logic')
+    @pytest.mark.pagination
+    def test_walks_all_elements_with_cursor(self, session, test_client):
+        ids = {getattr(obj, self.pk_field)
+               for obj in self.create_many_objects(session, 25)}
+        cursor = ''
+        for page_number in range(3):
+            res = test_client.get(urljoin(self.url(), '?' + urlencode({
+                self.view_class.cursor_parameter_name: cursor,
+                self.view_class.per_page_parameter_name: 10,
+            })))
+            assert res.status_code == 200
+            new_ids = [obj.get(self.pk_field) for obj in res.json['data']]
+            assert len(new_ids) == (5 if page_number == 2 else 10)
+            assert new_ids == sorted(new_ids)
+            assert set(new_ids).issubset(ids)
+            ids.difference_update(new_ids)
+            cursor = new_ids[-1]
+        assert not ids
+
+    @pytest.mark.usefixtures('pagination_test_logic')
+    @pytest.mark.pagination
+    def test_cursor_zero_starts_from_the_first_element(self, session, test_client):
+        ids = sorted(getattr(obj, self.pk_field)
+                     for obj in self.create_many_objects(session, 5))
+        res = test_client.get(urljoin(self.url(), '?' + urlencode({
+            self.view_class.cursor_parameter_name: 0,
+            self.view_class.per_page_parameter_name: 10,
+        })))
+        assert res.status_code == 200
+        assert [obj.get(self.pk_field) for obj in res.json['data']] == ids
+
+    @pytest.mark.usefixtures('pagination_test_logic')
+    @pytest.mark.pagination
+    def test_cursor_with_sort_fails(self, test_client):
+        res = test_client.get(urljoin(self.url(), '?' + urlencode({
+            self.view_class.cursor_parameter_name: '',
+            self.view_class.sort_field_parameter_name: self.pk_field,
+        })))
+        assert res.status_code == 400
+
+    @pytest.mark.usefixtures('pagination_test_logic')
+    @pytest.mark.pagination
+    def test_invalid_cursor(self, test_client):
+        res = test_client.get(urljoin(self.url(), '?' + urlencode({
+            self.view_class.cursor_parameter_name: 'invalid',
+            self.view_class.per_page_parameter_name: 10,
+        })))
+        assert res.status_code == 404
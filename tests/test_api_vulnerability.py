@@ -239,6 +239,22 @@ class TestListVulnerabilityView(ReadWriteAPITests, BulkUpdateTestsMixin, BulkDel
             result = set(vuln['value'].keys())
             assert expected - result == set()
 
+    def test_list_with_cursor(self, test_client):
+        ids = []
+        cursor = ''
+        while cursor is not None:
+            res = test_client.get(f'{self.url()}?cursor={cursor}&page_size=2')
+            assert res.status_code == 200
+            assert 'count' not in res.json
+            ids += [vuln['id'] for vuln in res.json['vulnerabilities']]
+            cursor = res.json['next_cursor']
+        assert ids == sorted(vuln.id for vuln in self.objects)
+
+        res = test_client.get(f'{self.url()}?cursor=&page_size=2&with_total=true')
+        assert res.status_code == 200
+        assert res.json['count'] == len(self.objects)
+        assert res.json['next_cursor'] == res.json['vulnerabilities'][-1]['id']
+
     def test_handles_vuln_with_no_creator(self,
                                           workspace,
                                           test_client,
@@ -4857,3 +4873,11 @@ def test_model_converter():
     field = VulnerabilitySchema().fields['data']
     assert isinstance(field, NullToBlankString)
     assert field.allow_none
+
+
+def test_lookup_field_follows_the_request_model_class(app):
+    view = VulnerabilityView()
+    with app.test_request_context(method='GET'):
+        assert view._get_lookup_field() is VulnerabilityGeneric.id
+    with app.test_request_context(method='POST', json={'type': 'VulnerabilityWeb'}):
+        assert view._get_lookup_field() is VulnerabilityWeb.id
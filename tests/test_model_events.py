@@ -6,8 +6,9 @@ See the file 'doc/LICENSE' for the license information
 '''
 
 import pytest
-from tests.factories import HostFactory, ServiceFactory
-from faraday.server.models import Host, Workspace
+from tests.factories import HostFactory, ServiceFactory, CommentFactory, TagFactory
+from faraday.server.events import _accumulate_histogram, _get_id_params
+from faraday.server.models import Host, Workspace, Vulnerability, Comment, TagObject
 
 
 def test_child_parent_verification_event_fails(session, workspace,
@@ -68,3 +69,46 @@ def test_child_parent_verification_event_changing_id_fails(session, workspace,
 
     with pytest.raises(AssertionError):
         session.commit()
+
+
+def test_histogram_counters_are_accumulated_per_workspace():
+    counters = {}
+    _accumulate_histogram(counters, 1, critical=-1, confirmed=-1)
+    _accumulate_histogram(counters, 1, high=-1)
+    _accumulate_histogram(counters, 2, medium=1)
+    _accumulate_histogram(counters, None, medium=1)
+
+    assert counters == {1: (0, -1, -1, -1), 2: (1, 0, 0, 0)}
+
+
+def test_get_id_params_from_whereclause(session):
+    query = session.query(Vulnerability).filter(Vulnerability.id.in_([1, 2]),
+                                                Vulnerability.severity == 'high')
+    assert _get_id_params(query.whereclause) == [1, 2]
+    assert _get_id_params(session.query(Vulnerability).whereclause) == []
+
+
+def test_get_id_params_ignores_other_id_columns(session):
+    query = session.query(Vulnerability).join(Host, Vulnerability.host_id == Host.id).filter(
+        Host.id == 3, Vulnerability.id == 4)
+    assert _get_id_params(query.whereclause) == [4]
+
+
+@pytest.mark.skip_sql_dialect('sqlite')
+def test_delete_host_deletes_its_comments_and_tags(session, workspace):
+    # PostgreSQL deletes them with a single writable CTE statement
+    host = HostFactory.create(workspace=workspace)
+    other_host = HostFactory.create(workspace=workspace)
+    session.commit()
+    for target in (host, other_host):
+        CommentFactory.create(object_id=target.id, object_type='host', workspace=workspace)
+        session.add(TagObject(object_id=target.id, object_type='host', tag=TagFactory.create()))
+    session.commit()
+    host_id, other_host_id = host.id, other_host.id
+
+    session.delete(host)
+    session.commit()
+
+    for model in (Comment, TagObject):
+        assert session.query(model).filter_by(object_id=host_id, object_type='host').count() == 0
+        assert session.query(model).filter_by(object_id=other_host_id, object_type='host').count() == 1
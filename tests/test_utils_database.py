@@ -7,13 +7,14 @@ See the file 'doc/LICENSE' for the license information
 
 import pytest
 
-from faraday.server.utils.database import get_unique_fields
+from faraday.server.utils.database import get_unique_fields, get_conflict_object
 from faraday.server.models import (
     License,
     Service,
     Host,
     Vulnerability,
     Workspace,
+    Tag,
     vulnerability_uniqueness
 )
 
@@ -69,3 +70,19 @@ def test_unique_fields_workspace(obj_class, expected_unique_fields, session):
     unique_constraints = get_unique_fields(session, object_)
     for unique_constraint in unique_constraints:
         assert unique_constraint == expected_unique_fields
+
+
+def test_conflict_object_on_any_unique_constraint(session):
+    first_tag = Tag(name='first', slug='first')
+    second_tag = Tag(name='second', slug='second')
+    session.add_all([first_tag, second_tag])
+    session.commit()
+
+    # Only the slug conflicts
+    assert get_conflict_object(session, Tag(), {'name': 'third', 'slug': 'second'}) == second_tag
+    # Both conflict on different rows, the first reflected constraint wins
+    constraint_columns = [columns[0] for columns in get_unique_fields(session, Tag())]
+    data = {'name': 'first', 'slug': 'second'}
+    expected = first_tag if constraint_columns[0] == 'name' else second_tag
+    assert get_conflict_object(session, Tag(), data) == expected
+    assert get_conflict_object(session, Tag(), {'name': 'third', 'slug': 'third'}) is None